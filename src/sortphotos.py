@@ -10,20 +10,32 @@ Copyright (c) S. Andrew Ning. All rights reserved.
 from __future__ import annotations
 
 import argparse
+import codecs
 import concurrent.futures
-import filecmp
+import contextlib
+import errno
+import fnmatch
+import functools
+import hashlib
+import itertools
 import json
 import locale
 import logging
+import math
+import multiprocessing
 import os
 import re
 import shutil
 import subprocess
 import sys
-from datetime import datetime, timedelta
-from fnmatch import fnmatch
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
 
 # Setting locale to the 'local' value
 locale.setlocale(locale.LC_ALL, '')
@@ -32,9 +44,49 @@ logger = logging.getLogger('sortphotos')
 
 exiftool_location: str = str(Path(__file__).resolve().parent / 'Image-ExifTool' / 'exiftool')
 
+# EXIF date: YYYY:MM:DD, optionally followed by HH:MM[:SS[.fraction]] and a Z or +/-HH:MM time zone.
+# Any other suffix starting with Z, + or - (e.g. +0200) is ignored, keeping the time of day
+_EXIF_DATE_RE = re.compile(
+    r'(?P<year>\d{4}):(?P<month>\d{1,2}):(?P<day>\d{1,2})'
+    r'(?:\s+(?P<hour>\d{1,2}):(?P<minute>\d{1,2})(?::(?P<second>\d{1,2})(?:\.\d*)?)?'
+    r'(?:(?P<tz_sign>[+-])(?P<tz_hour>\d{1,2}):(?P<tz_minute>\d{1,2})(?=\s|$)|[Z+-]\S*)?)?'
+    r'(?=\s|$)'
+)
+
+# whitespace and commas between records in ExifTool's JSON output
+_JSON_SEPARATOR_RE = re.compile(r'[\s,]*')
+
+# duplicate detection: files larger than this are first compared by a sampled fingerprint
+_FINGERPRINT_WINDOW: int = 64 * 1024
+_FINGERPRINT_MIN_SIZE: int = 3 * _FINGERPRINT_WINDOW
+_COMPARE_BLOCK_SIZE: int = 1024 * 1024
+
+# strftime directives that only depend on the date (not the time of day)
+_STRFTIME_DIRECTIVE_RE = re.compile(r'%[-_#0^]?(.)')
+_DAY_DIRECTIVES: frozenset[str] = frozenset('aAbBCdDeFgGhjmuUvVwWxyY%')
+
+# in-kernel copies: FICLONE ioctl (Linux) shares data blocks with the source on btrfs/XFS;
+# copy_file_range errors meaning "not possible here" fall back to a regular copy
+_FICLONE: int = 0x40049409
+_CAN_CLONE: bool = fcntl is not None and sys.platform.startswith('linux')
+_COPY_FALLBACK_ERRNOS: frozenset[int] = frozenset(
+    [errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EPERM])
+
+# fewest files worth starting another ExifTool process for
+_MIN_FILES_PER_EXIFTOOL: int = 100
+
+# above this many transfers, --jobs uses worker processes instead of threads
+_PROCESS_POOL_MIN_TRANSFERS: int = 10000
+
+# sampled fingerprints keyed by (path, size, mtime) so repeated collisions don't re-read files; holds at
+# most _FINGERPRINT_CACHE_SIZE entries (oldest dropped first) and is cleared after each run
+_FINGERPRINT_CACHE_SIZE: int = 65536
+_fingerprint_cache: dict[tuple[str, int, int], bytes] = {}
+
 
 # -------- convenience methods -------------
 
+@functools.lru_cache(maxsize=65536)  # the same date string usually appears under several tags and files
 def parse_date_exif(date_string: str) -> datetime | None:
     """
     extract date info from EXIF data
@@ -44,73 +96,34 @@ def parse_date_exif(date_string: str) -> datetime | None:
     or YYYY:MM:DD HH:MM:SSZ
     """
 
-    # split into date and time
-    elements = str(date_string).strip().split()  # ['YYYY:MM:DD', 'HH:MM:SS']
-
-    if len(elements) < 1:
+    match = _EXIF_DATE_RE.match(str(date_string).strip())
+    if match is None:
         return None
 
-    # parse year, month, day
-    date_entries = elements[0].split(':')  # ['YYYY', 'MM', 'DD']
-
-    # check if three entries, nonzero data, and no decimal (which occurs for timestamps with only time but no date)
-    if len(date_entries) == 3 and date_entries[0] > '0000' and '.' not in ''.join(date_entries):
-        year = int(date_entries[0])
-        month = int(date_entries[1])
-        day = int(date_entries[2])
-    else:
+    # some "valid" dates are way before 1900 and cannot be parsed by strftime later on all platforms
+    year = int(match['year'])
+    if year < 1900:
         return None
 
-    # parse hour, min, second
-    time_zone_adjust = False
-    hour = 12  # defaulting to noon if no time data provided
-    minute = 0
-    second = 0
-
-    if len(elements) > 1:
-        time_entries = re.split(r'(\+|-|Z)', elements[1])  # ['HH:MM:SS', '+', 'HH:MM']
-        time = time_entries[0].split(':')  # ['HH', 'MM', 'SS']
-
-        if len(time) == 3:
-            hour = int(time[0])
-            minute = int(time[1])
-            second = int(time[2].split('.')[0])
-        elif len(time) == 2:
-            hour = int(time[0])
-            minute = int(time[1])
-
-        # adjust for time-zone if needed
-        if len(time_entries) > 2:
-            time_zone = time_entries[2].split(':')  # ['HH', 'MM']
-
-            if len(time_zone) == 2:
-                time_zone_hour = int(time_zone[0])
-                time_zone_min = int(time_zone[1])
-
-                # check if + or -
-                if time_entries[1] == '+':
-                    time_zone_hour *= -1
-
-                dateadd = timedelta(hours=time_zone_hour, minutes=time_zone_min)
-                time_zone_adjust = True
-
+    # defaulting to noon if no time data provided
+    hour = int(match['hour'] or 12)
+    minute = int(match['minute'] or 0)
+    second = int(match['second'] or 0)
 
     # form date object
     try:
-        date = datetime(year, month, day, hour, minute, second)
-    except ValueError:
-        return None  # errors in time format
-
-    # try converting it (some "valid" dates are way before 1900 and cannot be parsed by strtime later)
-    try:
-        date.strftime('%Y/%m-%b')  # any format with year, month, day, would work here.
-    except ValueError:
+        time_zone = None
+        if match['tz_sign']:
+            offset = timedelta(hours=int(match['tz_hour']), minutes=int(match['tz_minute']))
+            time_zone = timezone(-offset if match['tz_sign'] == '-' else offset)
+        date = datetime(year, int(match['month']), int(match['day']), hour, minute, second, tzinfo=time_zone)
+
+        # times with a UTC offset are converted to UTC (naive, like all other dates)
+        if time_zone is not None:
+            date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    except (ValueError, OverflowError):
         return None  # errors in time format
 
-    # adjust for time zone if necessary
-    if time_zone_adjust:
-        date += dateadd
-
     return date
 
 
@@ -131,37 +144,39 @@ def get_oldest_timestamp(
     src_file = data['SourceFile']
 
     # setup tags to ignore
-    ignore_groups = ['ICC_Profile'] + additional_groups_to_ignore
-    ignore_tags = ['SourceFile', 'XMP:HistoryWhen'] + additional_tags_to_ignore
+    ignore_groups = frozenset(['ICC_Profile', *additional_groups_to_ignore])
+    ignore_tags = frozenset(['SourceFile', 'XMP:HistoryWhen', *additional_tags_to_ignore])
 
-    logger.debug('All relevant tags:')
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        logger.debug('All relevant tags:')
 
     # run through all keys
-    for key in data.keys():
+    for key, date in data.items():
 
         # check if this key needs to be ignored, or is in the set of tags that must be used
-        if (key not in ignore_tags) and (key.split(':')[0] not in ignore_groups) and 'GPS' not in key:
-
-            date = data[key]
+        if key in ignore_tags or key.partition(':')[0] in ignore_groups or 'GPS' in key:
+            continue
 
-            logger.debug(f'{key}, {date}')
+        if debug:
+            logger.debug('%s, %s', key, date)
 
-            # (rare) check if multiple dates returned in a list, take the first one which is the oldest
-            if isinstance(date, list):
-                date = date[0]
+        # (rare) check if multiple dates returned in a list, take the first one which is the oldest
+        if isinstance(date, list):
+            date = date[0]
 
-            try:
-                exifdate = parse_date_exif(date)  # check for poor-formed exif data, but allow continuation
-            except Exception:
-                exifdate = None
+        try:
+            exifdate = parse_date_exif(date)  # check for poor-formed exif data, but allow continuation
+        except Exception:
+            exifdate = None
 
-            if exifdate and exifdate < oldest_date:
-                date_available = True
-                oldest_date = exifdate
-                oldest_keys = [key]
+        if exifdate and exifdate < oldest_date:
+            date_available = True
+            oldest_date = exifdate
+            oldest_keys = [key]
 
-            elif exifdate and exifdate == oldest_date:
-                oldest_keys.append(key)
+        elif exifdate and exifdate == oldest_date:
+            oldest_keys.append(key)
 
     if not date_available:
         oldest_date = None
@@ -174,12 +189,114 @@ def check_for_early_morning_photos(date: datetime, day_begins: int) -> datetime:
     """check for early hour photos to be grouped with previous day"""
 
     if date.hour < day_begins:
-        logger.debug(f'moving this photo to the previous day for classification purposes (day_begins={day_begins})')
+        logger.debug('moving this photo to the previous day for classification purposes (day_begins=%d)', day_begins)
         date = date - timedelta(hours=date.hour+1)  # push it to the day before for classification purposes
 
     return date
 
 
+def _fingerprint(path: str, stat: os.stat_result) -> bytes:
+    """MD5 of three windows (start, middle, end) of a file, cached by (path, size, mtime)"""
+
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    digest = _fingerprint_cache.get(key)
+    if digest is None:
+        size = stat.st_size
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for offset in (0, size // 2 - _FINGERPRINT_WINDOW // 2, size - _FINGERPRINT_WINDOW):
+                f.seek(offset)
+                md5.update(f.read(_FINGERPRINT_WINDOW))
+        digest = md5.digest()
+        if len(_fingerprint_cache) >= _FINGERPRINT_CACHE_SIZE:
+            del _fingerprint_cache[next(iter(_fingerprint_cache))]
+        _fingerprint_cache[key] = digest
+    return digest
+
+
+def _same_contents(file1: str, file2: str) -> bool:
+    """compare two files block by block, stopping at the first difference"""
+
+    with open(file1, 'rb') as f1, open(file2, 'rb') as f2:
+        while True:
+            # bytes comparison is a memcmp; comparing memoryviews would go item by item
+            block1 = f1.read(_COMPARE_BLOCK_SIZE)
+            if block1 != f2.read(_COMPARE_BLOCK_SIZE):
+                return False
+            if not block1:
+                return True
+
+
+def _files_identical(file1: str, file2: str) -> bool:
+    """check if two files have the same contents: size, then sampled fingerprint, then every byte"""
+
+    stat1 = os.stat(file1)
+    stat2 = os.stat(file2)
+
+    # different sizes can't be duplicates (no reads needed)
+    if stat1.st_size != stat2.st_size:
+        return False
+
+    # cheap sampled comparison rules out most non-duplicates of large files
+    if stat1.st_size > _FINGERPRINT_MIN_SIZE and _fingerprint(file1, stat1) != _fingerprint(file2, stat2):
+        return False
+
+    return _same_contents(file1, file2)
+
+
+def _depends_only_on_day(date_format: str) -> bool:
+    """check if every strftime directive in date_format is determined by the calendar day alone"""
+
+    return all(directive in _DAY_DIRECTIVES for directive in _STRFTIME_DIRECTIVE_RE.findall(date_format))
+
+
+def _copy_file_in_kernel(src: str, dest: str) -> bool:
+    """
+    copy without passing data through Python: a copy-on-write clone (btrfs, XFS) if the filesystem
+    supports it, else copy_file_range (which can do server-side copies on NFS/SMB).
+    Returns False if neither is available so the caller can fall back to a regular copy.
+    """
+
+    if not _CAN_CLONE and not hasattr(os, 'copy_file_range'):
+        return False
+
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+        in_fd = fsrc.fileno()
+        out_fd = fdest.fileno()
+
+        if _CAN_CLONE:
+            try:
+                fcntl.ioctl(out_fd, _FICLONE, in_fd)
+                return True
+            except OSError:
+                pass  # not supported here, try the next method
+
+        if hasattr(os, 'copy_file_range'):
+            remaining = os.fstat(in_fd).st_size
+            try:
+                while remaining > 0:
+                    copied = os.copy_file_range(in_fd, out_fd, remaining)
+                    if copied == 0:
+                        # some filesystems report success without copying anything; let the
+                        # regular copy start over rather than leave a short file behind
+                        break
+                    remaining -= copied
+                return remaining == 0
+            except OSError as e:
+                if e.errno not in _COPY_FALLBACK_ERRNOS:
+                    raise
+
+    return False
+
+
+def _copy_file(src: str, dest: str) -> None:
+    """copy contents (in-kernel where the platform supports it) and then timestamps/permissions"""
+
+    if not _copy_file_in_kernel(src, dest):
+        shutil.copyfile(src, dest)
+    shutil.copystat(src, dest)
+
+
 def _transfer_file(
     src: str,
     dest: str,
@@ -188,9 +305,16 @@ def _transfer_file(
     """Move or copy a single file. Returns (src, dest, error_message_or_None)."""
     try:
         if copy:
-            shutil.copy2(src, dest)
+            _copy_file(src, dest)
         else:
-            shutil.move(src, dest)
+            try:
+                os.rename(src, dest)  # same filesystem: just a directory entry update
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # across filesystems: copy then remove the original
+                _copy_file(src, dest)
+                os.unlink(src)
         return (src, dest, None)
     except (PermissionError, OSError) as e:
         return (src, dest, str(e))
@@ -222,23 +346,164 @@ class ExifTool:
             self.process.kill()
             self.process.wait()
 
-    def execute(self, *args: str) -> str:
+    def _stream(self, *args: str) -> Iterator[str]:
+        """send a command and yield its output as it arrives, up to and including the sentinel"""
         args = args + ("-execute\n",)
-        self.process.stdin.write(str.join("\n", args).encode('utf-8'))
+        self.process.stdin.write(str.join("\n", args).encode('utf-8', 'surrogateescape'))
         self.process.stdin.flush()
-        output = ""
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        tail = ""
         fd = self.process.stdout.fileno()
-        while not output.rstrip(' \t\n\r').endswith(self.sentinel):
-            increment = os.read(fd, 4096)
-            logger.debug(increment.decode('utf-8'))
-            output += increment.decode('utf-8')
+        while not tail.rstrip(' \t\n\r').endswith(self.sentinel):
+            increment = os.read(fd, 65536)
+            if not increment:
+                raise RuntimeError('ExifTool exited unexpectedly')
+            text = decoder.decode(increment)
+            logger.debug(text)
+            tail = (tail + text)[-64:]
+            yield text
+
+    def supported_extensions(self) -> set[str]:
+        """file extensions (upper case) of the file types ExifTool can read"""
+        output = self.execute('-listf')
+        return set(output.partition(':')[2].split())
+
+    def execute(self, *args: str) -> str:
+        output = "".join(self._stream(*args))
         return output.rstrip(' \t\n\r')[:-len(self.sentinel)]
 
-    def get_metadata(self, *args: str) -> list[dict[str, Any]]:
+    def get_metadata(self, *args: str) -> Iterator[dict[str, Any]]:
+        """yield the JSON record for each file as soon as ExifTool has written it"""
+
+        decoder = json.JSONDecoder()
+        buffer = ""
+        started = False  # opening bracket of the JSON array seen
+        done = False  # closing bracket seen (or output is not a JSON array)
+
+        for text in self._stream(*args):
+            if done:
+                continue  # keep reading up to the sentinel so the next command starts clean
+            buffer += text
+            pos = 0
+            while not done:
+                pos = _JSON_SEPARATOR_RE.match(buffer, pos).end()
+                if pos == len(buffer):
+                    break  # wait for more output
+                if not started:
+                    # anything but a JSON array (e.g. no files to parse) is invalid
+                    started = buffer[pos] == '['
+                    done = not started
+                    pos += 1
+                elif buffer[pos] == ']':
+                    done = True
+                else:
+                    try:
+                        data, pos = decoder.raw_decode(buffer, pos)
+                    except ValueError:
+                        break  # record not complete yet
+                    yield data
+            buffer = buffer[pos:]
+
+        if not (started and done):
+            raise RuntimeError('No files to parse or invalid data')
+
+
+class ExifToolPool:
+    """
+    up to n ExifTool processes kept open side by side.  Only one is started up front; more are
+    started when there are enough files to make splitting them worthwhile.
+    """
+
+    def __init__(self, n: int, executable: str = exiftool_location) -> None:
+        self.n = n
+        self.executable = executable
+        self.tools: list[ExifTool] = []
+
+    def __enter__(self) -> ExifToolPool:
+        with contextlib.ExitStack() as stack:
+            self._stack = stack
+            self._start(1)
+            self._stack = stack.pop_all()
+        return self
+
+    def __exit__(self, exc_type: type | None, exc_value: BaseException | None, traceback: Any) -> None:
+        self._stack.close()
+
+    def _start(self, n: int) -> None:
+        while len(self.tools) < n:
+            self.tools.append(self._stack.enter_context(ExifTool(self.executable)))
+
+    def supported_extensions(self) -> set[str]:
+        return self.tools[0].supported_extensions()
+
+    def get_metadata(self, args: list[str], files: list[str]) -> Iterator[dict[str, Any]]:
+        """extract metadata for files, split into equal chunks across the processes"""
+
+        n = min(self.n, math.ceil(len(files) / _MIN_FILES_PER_EXIFTOOL))
+        if n <= 1:
+            # records are streamed, so processing starts while ExifTool is still running
+            return self.tools[0].get_metadata(*args, *files)
+
+        self._start(n)
+        size = math.ceil(len(files) / n)
+        chunks = [files[i:i + size] for i in range(0, len(files), size)]
+
+        def run(tool: ExifTool, chunk: list[str]) -> list[dict[str, Any]]:
+            return list(tool.get_metadata(*args, *chunk))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            results = list(executor.map(run, self.tools, chunks))
+        return iter([data for result in results for data in result])
+
+
+def _walk(
+    src_dir: str,
+    recursive: bool,
+    extensions: set[str],
+    exclude_re: re.Pattern[str] | None,
+) -> tuple[list[str], int]:
+    """
+    list the files ExifTool would process when scanning src_dir (supported file types only, hidden
+    directories skipped when recursing), leaving out files matching exclude_re.
+    src_dir may also be a single file, which is processed whatever its type.
+    Returns the files and the number excluded.
+    """
+
+    if not os.path.isdir(src_dir):
+        if exclude_re is not None and (exclude_re.match(os.path.normcase(os.path.basename(src_dir)))
+                                       or exclude_re.match(os.path.normcase(src_dir))):
+            return [], 1
+        return [src_dir], 0
+
+    files: list[str] = []
+    excluded = 0
+    stack = [src_dir]
+    while stack:
+        path = stack.pop()
         try:
-            return json.loads(self.execute(*args))
-        except ValueError as e:
-            raise RuntimeError('No files to parse or invalid data') from e
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if recursive and not entry.name.startswith('.'):
+                            stack.append(entry.path)
+                        continue
+
+                    # same rule as ExifTool: the extension (or the whole name if none) must be a supported type
+                    if entry.name.rpartition('.')[2].upper() not in extensions:
+                        continue
+
+                    if exclude_re is not None and (exclude_re.match(os.path.normcase(entry.name))
+                                                   or exclude_re.match(os.path.normcase(entry.path))):
+                        logger.debug('Excluded by pattern: %s', entry.path)
+                        excluded += 1
+                    elif '\n' in entry.name:
+                        logger.warning(f'Skipping file with a newline in its name: {entry.path!r}')
+                    else:
+                        files.append(entry.path)
+        except OSError as e:
+            logger.warning(f'Error reading directory {path}: {e}')
+
+    return files, excluded
 
 
 # ---------------------------------------
@@ -303,7 +568,7 @@ def sortPhotos(
     exclude_patterns : list[str]
         glob patterns for files to exclude (e.g., ['*.raw', 'backup/*'])
     jobs : int
-        number of parallel workers for file operations (default: 1 for serial)
+        number of parallel workers for metadata extraction and file operations (default: 1 for serial)
 
     Returns
     -------
@@ -339,10 +604,14 @@ def sortPhotos(
         args += ['-time:all']
 
 
-    if recursive:
-        args += ['-r']
+    # ExifTool needs to be told to read (and report) file names as UTF-8 on Windows
+    if sys.platform == 'win32':
+        args += ['-charset', 'filename=utf8']
 
-    args += [src_dir]
+    # combine exclude patterns into one regex (same matching rules as fnmatch.fnmatch)
+    exclude_re = None
+    if exclude_patterns:
+        exclude_re = re.compile('|'.join(fnmatch.translate(os.path.normcase(pat)) for pat in exclude_patterns))
 
     # statistics tracking
     stats: dict[str, int] = {
@@ -356,170 +625,206 @@ def sortPhotos(
     }
 
     # get all metadata
-    with ExifTool() as e:
+    with contextlib.ExitStack() as stack:
+        stack.callback(_fingerprint_cache.clear)
+        exiftools = stack.enter_context(ExifToolPool(jobs))
+
+        # walk the source tree here rather than with ExifTool's -r, so excluded files are never read
+        # and the number of files is known up front
+        src_files, stats['skipped_excluded'] = _walk(src_dir, recursive, exiftools.supported_extensions(), exclude_re)
+        if not src_files and not stats['skipped_excluded']:
+            raise RuntimeError('No files to parse or invalid data')
+
         logger.info('Preprocessing with ExifTool.  May take a while for a large number of files.')
         sys.stdout.flush()
-        metadata = e.get_metadata(*args)
+        metadata = exiftools.get_metadata(args, src_files) if src_files else iter([])
 
-    # setup output to screen
-    num_files = len(metadata)
+        # setup output to screen
+        num_files = len(src_files)
 
-    if test:
-        test_file_dict: dict[str, str] = {}
+        # file names in each destination directory, read once with scandir when the directory is
+        # first used (and created) and kept up to date as destinations are reserved, so neither
+        # mkdir nor collision checks need syscalls per file.  Keyed by the casefolded name, since
+        # names differing only in case are the same file on case-insensitive volumes (macOS, Windows)
+        dir_cache: dict[str, dict[str, str]] = {}
 
-    # collect pending file transfers for parallel execution
-    pending_transfers: list[tuple[str, str]] = []
+        # destination directory for each day (or timestamp) seen so far
+        sort_by_day = _depends_only_on_day(sort_format)
+        dest_paths: dict[Any, str] = {}
 
-    # determine if we should show progress bar
-    show_progress = logger.getEffectiveLevel() >= logging.INFO and num_files > 0
-    try:
-        from tqdm import tqdm
-        progress = tqdm(total=num_files, disable=not show_progress, unit='file')
-    except ImportError:
-        progress = None
+        # source file of each destination reserved during this run (not on disk yet), only needed
+        # for duplicate checks; the names themselves are tracked in dir_cache
+        reserved: dict[str, str] = {}
 
-    # parse output extracting oldest relevant date
-    for idx, data in enumerate(metadata):
+        # collect pending file transfers for parallel execution
+        pending_transfers: list[tuple[str, str]] = []
 
-        # extract timestamp date for photo
-        src_file, date, keys = get_oldest_timestamp(data, additional_groups_to_ignore, additional_tags_to_ignore)
+        # determine if we should show progress bar
+        show_progress = logger.getEffectiveLevel() >= logging.INFO and num_files > 0
+        try:
+            from tqdm import tqdm
+            progress = tqdm(total=num_files, disable=not show_progress, unit='file')
+        except ImportError:
+            progress = None
+
+        # extract the oldest relevant date for each file as its metadata streams in, and resolve
+        # destinations in order since collision handling depends on earlier files.  This is pure
+        # Python holding the GIL, so it stays serial: threads would only add overhead
+        extract = functools.partial(get_oldest_timestamp,
+                                    additional_groups_to_ignore=additional_groups_to_ignore,
+                                    additional_tags_to_ignore=additional_tags_to_ignore)
+        timestamps = map(extract, metadata)
+
+        # debug messages are only formatted when they will be shown
+        debug = logger.isEnabledFor(logging.DEBUG)
+
+        for idx, (src_file, date, keys) in enumerate(timestamps):
+
+            if debug:
+                ending = ']'
+                if test:
+                    ending = '] (TEST - no files are being moved/copied)'
+                logger.debug('[%d/%d%s', idx + 1, num_files, ending)
+                logger.debug('Source: %s', src_file)
 
-        if logger.getEffectiveLevel() <= logging.DEBUG:
-            ending = ']'
-            if test:
-                ending = '] (TEST - no files are being moved/copied)'
-            logger.debug(f'[{idx+1}/{num_files}{ending}')
-            logger.debug(f'Source: {src_file}')
+            # update progress bar
+            if progress is not None:
+                progress.update(1)
 
-        # update progress bar
-        if progress is not None:
-            progress.update(1)
-
-        # check for excluded patterns
-        if exclude_patterns:
-            src_path = Path(src_file)
-            if any(fnmatch(src_path.name, pat) or fnmatch(str(src_path), pat) for pat in exclude_patterns):
-                logger.debug(f'Excluded by pattern: {src_file}')
-                stats['skipped_excluded'] += 1
+            src_basename = os.path.basename(src_file)
+
+            # check if no valid date found
+            if not date:
+                logger.debug('No valid dates were found using the specified tags.  File will remain where it is.')
+                stats['skipped_no_date'] += 1
                 continue
 
-        # check if no valid date found
-        if not date:
-            logger.debug('No valid dates were found using the specified tags.  File will remain where it is.')
-            stats['skipped_no_date'] += 1
-            continue
+            # ignore hidden files
+            if src_basename.startswith('.'):
+                logger.debug('hidden file.  will be skipped')
+                stats['skipped_hidden'] += 1
+                continue
 
-        # ignore hidden files
-        if Path(src_file).name.startswith('.'):
-            logger.debug('hidden file.  will be skipped')
-            stats['skipped_hidden'] += 1
-            continue
+            if debug:
+                logger.debug('Date/Time: %s', date)
+                logger.debug('Corresponding Tags: %s', ', '.join(keys))
 
-        logger.debug(f'Date/Time: {date}')
-        logger.debug(f'Corresponding Tags: {", ".join(keys)}')
+            # early morning photos can be grouped with previous day (depending on user setting)
+            date = check_for_early_morning_photos(date, day_begins)
 
-        # early morning photos can be grouped with previous day (depending on user setting)
-        date = check_for_early_morning_photos(date, day_begins)
 
+            # create folder structure (formatted once per day, or per timestamp if the format uses the time)
+            dest_key = date.date() if sort_by_day else date
+            dest_path = dest_paths.get(dest_key)
+            if dest_path is None:
+                dest_path = dest_paths[dest_key] = os.path.join(dest_dir, date.strftime(sort_format))
 
-        # create folder structure
-        dir_structure = date.strftime(sort_format)
-        dest_path = Path(dest_dir) / dir_structure
-        if not test:
-            try:
-                dest_path.mkdir(parents=True, exist_ok=True)
-            except PermissionError:
-                logger.error(f'Permission denied creating directory: {dest_path}')
-                stats['errors'] += 1
-                continue
-            except OSError as e:
-                logger.error(f'Error creating directory {dest_path}: {e}')
-                stats['errors'] += 1
-                continue
+            # first file for this directory: create it and read the names already in it
+            dest_names = dir_cache.get(dest_path)
+            if dest_names is None:
+                if not test:
+                    try:
+                        os.makedirs(dest_path, exist_ok=True)
+                    except PermissionError:
+                        logger.error(f'Permission denied creating directory: {dest_path}')
+                        stats['errors'] += 1
+                        continue
+                    except OSError as e:
+                        logger.error(f'Error creating directory {dest_path}: {e}')
+                        stats['errors'] += 1
+                        continue
+                try:
+                    with os.scandir(dest_path) as entries:
+                        dest_names = {entry.name.casefold(): entry.name for entry in entries if entry.is_file()}
+                except OSError:
+                    dest_names = {}  # not created yet (test mode)
+                dir_cache[dest_path] = dest_names
 
-        # rename file if necessary
-        filename = Path(src_file).name
+            # rename file if necessary
+            filename = src_basename
+            src_stem, src_ext = os.path.splitext(src_basename)
 
-        if rename_format is not None and date is not None:
-            ext = Path(filename).suffix
-            filename = date.strftime(rename_format) + ext.lower()
+            if rename_format is not None and date is not None:
+                filename = date.strftime(rename_format) + src_ext.lower()
 
-        # setup destination file
-        dest_file = str(dest_path / filename)
-        root, ext = os.path.splitext(dest_file)
+            # setup destination file
+            dest_file = os.path.join(dest_path, filename)
+            root, ext = os.path.splitext(dest_file)
 
-        if copy_files:
-            logger.debug(f'Destination (copy): {dest_file}')
-        else:
-            logger.debug(f'Destination (move): {dest_file}')
+            if debug:
+                logger.debug('Destination (%s): %s', 'copy' if copy_files else 'move', dest_file)
 
 
-        # check for collisions
-        append = 1
-        fileIsIdentical = False
+            # check for collisions: probe suffixes against the cached names until one is free,
+            # comparing contents with each taken name on the way
+            fileIsIdentical = False
 
-        while True:
+            for append in itertools.count(1):
+                taken = dest_names.get(filename.casefold())
+                if taken is None:
+                    break
 
-            if (not test and Path(dest_file).is_file()) or (test and dest_file in test_file_dict):  # check for existing name
-                if test:
-                    dest_compare = test_file_dict[dest_file]
-                else:
-                    dest_compare = dest_file
-                if remove_duplicates and filecmp.cmp(src_file, dest_compare):  # check for identical files
+                # compare with the file on disk, or the source of a destination reserved earlier
+                taken_file = os.path.join(dest_path, taken)
+                dest_compare = reserved.get(taken_file, taken_file)
+                if remove_duplicates and _files_identical(src_file, dest_compare):  # check for identical files
                     fileIsIdentical = True
                     logger.debug('Identical file already exists.  Duplicate will be ignored.')
                     stats['skipped_duplicate'] += 1
                     break
 
-                else:  # name is same, but file is different
-                    if keep_filename:
-                        orig_filename = Path(src_file).stem
-                        dest_file = f'{root}_{orig_filename}_{append}{ext}'
-                    else:
-                        dest_file = f'{root}_{append}{ext}'
-                    append += 1
-                    stats['renamed_collision'] += 1
-                    logger.debug(f'Same name already exists...renaming to: {dest_file}')
-
-            else:
-                break
-
-
-        # finally move or copy the file
-        if test:
-            test_file_dict[dest_file] = src_file
-            if not fileIsIdentical:
-                stats['processed'] += 1
+                # name is same, but file is different
+                if keep_filename:
+                    dest_file = f'{root}_{src_stem}_{append}{ext}'
+                else:
+                    dest_file = f'{root}_{append}{ext}'
+                filename = os.path.basename(dest_file)
+                stats['renamed_collision'] += 1
+                if debug:
+                    logger.debug('Same name already exists...renaming to: %s', dest_file)
 
-        else:
 
+            # finally move or copy the file
             if fileIsIdentical:
                 continue  # ignore identical files
-            else:
-                pending_transfers.append((src_file, dest_file))
-                stats['processed'] += 1
 
-    if progress is not None:
-        progress.close()
+            dest_names[filename.casefold()] = filename
+            if remove_duplicates:
+                reserved[dest_file] = src_file
+            if not test:
+                pending_transfers.append((src_file, dest_file))
+            stats['processed'] += 1
 
-    # execute file transfers
-    if not test and pending_transfers:
-        if jobs > 1:
-            logger.info(f'Transferring {len(pending_transfers)} files with {jobs} workers...')
-            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        if progress is not None:
+            progress.close()
+
+        # execute file transfers
+        if not test and pending_transfers:
+            if jobs <= 1:
+                results = (_transfer_file(s, d, copy_files) for s, d in pending_transfers)
+            elif len(pending_transfers) > _PROCESS_POOL_MIN_TRANSFERS:
+                # with this many files the per-file Python work (stat, error handling) is significant,
+                # so use processes rather than threads that would contend for the GIL
+                logger.info(f'Transferring {len(pending_transfers)} files with {jobs} worker processes...')
+                # the ExifTool pipes (and any helper threads) are still open here, so don't fork this
+                # process: start workers from a clean forkserver where the platform has one
+                mp_context = (multiprocessing.get_context('forkserver')
+                              if 'forkserver' in multiprocessing.get_all_start_methods() else None)
+                process_pool = stack.enter_context(
+                    concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=mp_context))
+                srcs, dests = zip(*pending_transfers)
+                results = process_pool.map(_transfer_file, srcs, dests, itertools.repeat(copy_files),
+                                           chunksize=max(1, len(pending_transfers) // (jobs * 8)))
+            else:
+                logger.info(f'Transferring {len(pending_transfers)} files with {jobs} workers...')
+                pool = stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=jobs))
                 futures = {
                     pool.submit(_transfer_file, s, d, copy_files): (s, d)
                     for s, d in pending_transfers
                 }
-                for future in concurrent.futures.as_completed(futures):
-                    src, dest, error = future.result()
-                    if error:
-                        logger.error(f'Error: {src} -> {dest}: {error}')
-                        stats['errors'] += 1
-                        stats['processed'] -= 1
-        else:
-            for src, dest in pending_transfers:
-                src, dest, error = _transfer_file(src, dest, copy_files)
+                results = (future.result() for future in concurrent.futures.as_completed(futures))
+
+            for src, dest, error in results:
                 if error:
                     logger.error(f'Error: {src} -> {dest}: {error}')
                     stats['errors'] += 1
@@ -600,7 +905,7 @@ def main() -> None:
                     help='glob patterns for files to exclude\n\
     e.g., --exclude "*.raw" "backup/*"')
     parser.add_argument('-j', '--jobs', type=int, default=1,
-                    help='number of parallel workers for file operations (default: 1)')
+                    help='number of parallel workers for metadata extraction and file operations (default: 1)')
 
     # parse command line arguments
     args = parser.parse_args()
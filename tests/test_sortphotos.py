@@ -2,8 +2,11 @@
 
 from __future__ import annotations
 
+import errno
+import fnmatch
 import logging
 import os
+import re
 import shutil
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -13,84 +16,61 @@ import pytest
 
 from src.sortphotos import (
     ExifTool,
+    _depends_only_on_day,
+    _files_identical,
+    _fingerprint_cache,
+    _transfer_file,
+    _walk,
     check_for_early_morning_photos,
     get_oldest_timestamp,
     parse_date_exif,
     sortPhotos,
 )
 
+_HAS_PERL = shutil.which('perl') is not None
+
 
 # ---------------------------------------------------------------------------
 # parse_date_exif
 # ---------------------------------------------------------------------------
 
-class TestParseDateExif:
-    def test_basic_datetime(self):
-        result = parse_date_exif('2023:06:15 14:30:00')
-        assert result == datetime(2023, 6, 15, 14, 30, 0)
-
-    def test_date_only_defaults_to_noon(self):
-        result = parse_date_exif('2023:06:15')
-        assert result == datetime(2023, 6, 15, 12, 0, 0)
-
-    def test_with_positive_timezone(self):
-        # +05:00 means subtract 5 hours to get UTC
-        result = parse_date_exif('2023:06:15 14:30:00+05:00')
-        assert result == datetime(2023, 6, 15, 9, 30, 0)
-
-    def test_with_negative_timezone(self):
-        result = parse_date_exif('2023:06:15 14:30:00-03:00')
-        assert result == datetime(2023, 6, 15, 17, 30, 0)
-
-    def test_with_z_timezone(self):
-        result = parse_date_exif('2023:06:15 14:30:00Z')
-        assert result == datetime(2023, 6, 15, 14, 30, 0)
-
-    def test_empty_string(self):
-        assert parse_date_exif('') is None
-
-    def test_zero_date(self):
-        assert parse_date_exif('0000:00:00 00:00:00') is None
-
-    def test_invalid_string(self):
-        assert parse_date_exif('not a date') is None
-
-    def test_decimal_in_date(self):
-        # timestamps with only time have decimals
-        assert parse_date_exif('12.34.56') is None
-
-    def test_subsecond_time(self):
-        result = parse_date_exif('2023:06:15 14:30:05.123')
-        assert result == datetime(2023, 6, 15, 14, 30, 5)
-
-    def test_hh_mm_only(self):
-        result = parse_date_exif('2023:06:15 14:30')
-        assert result == datetime(2023, 6, 15, 14, 30, 0)
-
-    def test_very_old_date(self):
-        # Dates before 1900 may or may not be parseable depending on platform.
-        # The function tries strftime and returns None if it fails.
-        result = parse_date_exif('1800:01:01 00:00:00')
-        # On platforms where strftime handles pre-1900, we get a valid date
-        if result is not None:
-            assert result == datetime(1800, 1, 1, 0, 0, 0)
-        # On platforms where it fails, we get None — both are acceptable
-
-    def test_none_input(self):
-        # str(None) = 'None' which should fail gracefully
-        assert parse_date_exif(None) is None
-
-    def test_integer_input(self):
-        assert parse_date_exif(12345) is None
+# (input, expected) pairs; tz offsets are converted to UTC, dates before 1900 are rejected
+_PARSE_DATE_EXIF_CASES = (
+    pytest.param('2023:06:15 14:30:00', datetime(2023, 6, 15, 14, 30, 0), id='basic_datetime'),
+    pytest.param('2023:06:15', datetime(2023, 6, 15, 12, 0, 0), id='date_only_defaults_to_noon'),
+    pytest.param('2023:06:15 14:30:00+05:00', datetime(2023, 6, 15, 9, 30, 0), id='positive_timezone'),
+    pytest.param('2023:06:15 14:30:00-03:00', datetime(2023, 6, 15, 17, 30, 0), id='negative_timezone'),
+    pytest.param('2023:06:15 14:30:00+05:30', datetime(2023, 6, 15, 9, 0, 0), id='half_hour_positive_timezone'),
+    pytest.param('2023:06:15 14:30:00-03:30', datetime(2023, 6, 15, 18, 0, 0), id='half_hour_negative_timezone'),
+    pytest.param('2023:06:15 14:30:00+25:00', None, id='invalid_timezone'),
+    pytest.param('2023:06:15 14:30:00Z', datetime(2023, 6, 15, 14, 30, 0), id='z_timezone'),
+    pytest.param('2023:06:15 14:30:00+0200', datetime(2023, 6, 15, 14, 30, 0), id='unrecognised_timezone_ignored'),
+    pytest.param('2023:06:15 14:30:00+02', datetime(2023, 6, 15, 14, 30, 0), id='hour_only_timezone_ignored'),
+    pytest.param('2023:06:15 14:30:00+02:00:00', datetime(2023, 6, 15, 14, 30, 0), id='malformed_timezone_ignored'),
+    pytest.param('', None, id='empty_string'),
+    pytest.param('0000:00:00 00:00:00', None, id='zero_date'),
+    pytest.param('not a date', None, id='invalid_string'),
+    pytest.param('12.34.56', None, id='decimal_in_date'),  # timestamps with only time have decimals
+    pytest.param('2023:06:15 14:30:05.123', datetime(2023, 6, 15, 14, 30, 5), id='subsecond_time'),
+    pytest.param('2023:06:15 14:30', datetime(2023, 6, 15, 14, 30, 0), id='hh_mm_only'),
+    pytest.param('1800:01:01 00:00:00', None, id='very_old_date'),
+    pytest.param('1900:01:01 00:00:00', datetime(1900, 1, 1, 0, 0, 0), id='year_1900_accepted'),
+    pytest.param(None, None, id='none_input'),  # str(None) = 'None' which should fail gracefully
+    pytest.param(12345, None, id='integer_input'),
+    pytest.param('   ', None, id='whitespace_only'),
+    pytest.param('2023:13:15 14:30:00', None, id='invalid_month'),
+    pytest.param('2023:06:32 14:30:00', None, id='invalid_day'),
+)
 
-    def test_whitespace_only(self):
-        assert parse_date_exif('   ') is None
 
-    def test_invalid_month(self):
-        assert parse_date_exif('2023:13:15 14:30:00') is None
+class TestParseDateExif:
+    @pytest.mark.parametrize('raw,expected', _PARSE_DATE_EXIF_CASES)
+    def test_parse_date_exif(self, raw, expected):
+        assert parse_date_exif(raw) == expected
 
-    def test_invalid_day(self):
-        assert parse_date_exif('2023:06:32 14:30:00') is None
+    def test_repeated_string_is_cached(self):
+        first = parse_date_exif('2023:06:15 14:30:00')
+        assert parse_date_exif('2023:06:15 14:30:00') is first
 
 
 # ---------------------------------------------------------------------------
@@ -227,15 +207,161 @@ class TestCheckForEarlyMorningPhotos:
         assert result.day == 14
 
 
+# ---------------------------------------------------------------------------
+# _depends_only_on_day
+# ---------------------------------------------------------------------------
+
+class TestDependsOnlyOnDay:
+    def test_default_sort_format(self):
+        assert _depends_only_on_day('%Y/%m-%b')
+
+    def test_week_and_weekday(self):
+        assert _depends_only_on_day('%y/%W/%a')
+
+    def test_time_directive(self):
+        assert not _depends_only_on_day('%Y/%m-%d_%H')
+
+    def test_locale_datetime(self):
+        assert not _depends_only_on_day('%c')
+
+    def test_escaped_percent(self):
+        assert _depends_only_on_day('%Y/100%%H')
+
+
+# ---------------------------------------------------------------------------
+# _files_identical
+# ---------------------------------------------------------------------------
+
+class TestFilesIdentical:
+    def test_identical_small_files(self, tmp_path):
+        (tmp_path / 'a.jpg').write_bytes(b'same content')
+        (tmp_path / 'b.jpg').write_bytes(b'same content')
+        assert _files_identical(str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg'))
+
+    def test_different_sizes(self, tmp_path):
+        (tmp_path / 'a.jpg').write_bytes(b'short')
+        (tmp_path / 'b.jpg').write_bytes(b'longer content')
+        assert not _files_identical(str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg'))
+
+    def test_same_size_different_content(self, tmp_path):
+        (tmp_path / 'a.jpg').write_bytes(b'content A')
+        (tmp_path / 'b.jpg').write_bytes(b'content B')
+        assert not _files_identical(str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg'))
+
+    def test_identical_large_files(self, tmp_path):
+        data = os.urandom(500 * 1024)
+        (tmp_path / 'a.jpg').write_bytes(data)
+        (tmp_path / 'b.jpg').write_bytes(data)
+        assert _files_identical(str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg'))
+
+    def test_large_files_differing_outside_sampled_windows(self, tmp_path):
+        # fingerprints match, so the full comparison must catch the difference
+        data = bytearray(500 * 1024)
+        (tmp_path / 'a.jpg').write_bytes(data)
+        data[100 * 1024] = 1
+        (tmp_path / 'b.jpg').write_bytes(data)
+        assert not _files_identical(str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg'))
+
+    def test_difference_after_first_compare_block(self, tmp_path):
+        data = bytearray(1536 * 1024)
+        (tmp_path / 'a.jpg').write_bytes(data)
+        data[1200 * 1024] = 1
+        (tmp_path / 'b.jpg').write_bytes(data)
+        assert not _files_identical(str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg'))
+
+    def test_fingerprint_cache_is_bounded(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('src.sortphotos._FINGERPRINT_CACHE_SIZE', 2)
+        _fingerprint_cache.clear()
+        data = os.urandom(500 * 1024)
+        for name in ['a.jpg', 'b.jpg', 'c.jpg']:
+            (tmp_path / name).write_bytes(data)
+        assert _files_identical(str(tmp_path / 'a.jpg'), str(tmp_path / 'b.jpg'))
+        assert _files_identical(str(tmp_path / 'b.jpg'), str(tmp_path / 'c.jpg'))
+        assert list(key[0] for key in _fingerprint_cache) == [str(tmp_path / 'b.jpg'), str(tmp_path / 'c.jpg')]
+        _fingerprint_cache.clear()
+
+
+# ---------------------------------------------------------------------------
+# _transfer_file
+# ---------------------------------------------------------------------------
+
+class TestTransferFile:
+    def test_copy_preserves_source_and_mtime(self, tmp_path):
+        src = tmp_path / 'src.jpg'
+        src.write_text('photo')
+        os.utime(src, (1_000_000_000, 1_000_000_000))
+        dest = tmp_path / 'dest.jpg'
+
+        assert _transfer_file(str(src), str(dest), copy=True) == (str(src), str(dest), None)
+        assert src.exists()
+        assert dest.read_text() == 'photo'
+        assert dest.stat().st_mtime == 1_000_000_000
+
+    def test_move_removes_source(self, tmp_path):
+        src = tmp_path / 'src.jpg'
+        src.write_text('photo')
+        dest = tmp_path / 'dest.jpg'
+
+        assert _transfer_file(str(src), str(dest), copy=False)[2] is None
+        assert not src.exists()
+        assert dest.read_text() == 'photo'
+
+    def test_move_across_filesystems_falls_back_to_copy(self, tmp_path):
+        src = tmp_path / 'src.jpg'
+        src.write_text('photo')
+        dest = tmp_path / 'dest.jpg'
+
+        with patch('src.sortphotos.os.rename', side_effect=OSError(errno.EXDEV, 'cross-device link')):
+            assert _transfer_file(str(src), str(dest), copy=False)[2] is None
+        assert not src.exists()
+        assert dest.read_text() == 'photo'
+
+    def test_copy_falls_back_when_in_kernel_copy_unsupported(self, tmp_path):
+        src = tmp_path / 'src.jpg'
+        src.write_bytes(os.urandom(100_000))
+        dest = tmp_path / 'dest.jpg'
+
+        with patch('src.sortphotos._CAN_CLONE', False), \
+                patch('src.sortphotos.os.copy_file_range', create=True,
+                      side_effect=OSError(errno.EXDEV, 'cross-device link')):
+            assert _transfer_file(str(src), str(dest), copy=True)[2] is None
+        assert dest.read_bytes() == src.read_bytes()
+
+    def test_move_falls_back_when_in_kernel_copy_copies_nothing(self, tmp_path):
+        src = tmp_path / 'src.jpg'
+        data = os.urandom(100_000)
+        src.write_bytes(data)
+        dest = tmp_path / 'dest.jpg'
+
+        with patch('src.sortphotos.os.rename', side_effect=OSError(errno.EXDEV, 'cross-device link')), \
+                patch('src.sortphotos._CAN_CLONE', False), \
+                patch('src.sortphotos.os.copy_file_range', create=True, return_value=0):
+            assert _transfer_file(str(src), str(dest), copy=False)[2] is None
+        assert not src.exists()
+        assert dest.read_bytes() == data
+
+    def test_error_is_returned(self, tmp_path):
+        src = tmp_path / 'missing.jpg'
+        dest = tmp_path / 'dest.jpg'
+        assert _transfer_file(str(src), str(dest), copy=True)[2] is not None
+
+
 # ---------------------------------------------------------------------------
 # ExifTool
 # ---------------------------------------------------------------------------
 
+@pytest.fixture(scope='session')
+def exiftool():
+    """One real ExifTool process shared by the slow tests."""
+    if not _HAS_PERL:
+        pytest.skip('perl not available')
+    with ExifTool() as et:
+        yield et
+
+
 class TestExifTool:
-    @pytest.mark.skipif(
-        shutil.which('perl') is None,
-        reason='perl not available',
-    )
+    @pytest.mark.slow
+    @pytest.mark.skipif(not _HAS_PERL, reason='perl not available')
     def test_context_manager_starts_and_stops_process(self):
         with ExifTool() as et:
             assert et.process.pid is not None
@@ -244,121 +370,209 @@ class TestExifTool:
         # after exit, process should have terminated
         assert et.process.poll() is not None
 
+    @pytest.mark.slow
+    def test_supported_extensions(self, exiftool):
+        extensions = exiftool.supported_extensions()
+        assert {'JPG', 'CR2', 'MOV'} <= extensions
+        assert exiftool.process.poll() is None  # still running for the next command
+
     def test_get_metadata_raises_on_invalid_json(self):
         et = ExifTool()
-        et.execute = MagicMock(return_value='not valid json')
+        et._stream = MagicMock(return_value=iter(['not valid json\n{ready}\n']))
         with pytest.raises(RuntimeError, match='No files to parse or invalid data'):
-            et.get_metadata()
+            list(et.get_metadata())
+
+    def test_get_metadata_raises_on_truncated_json(self):
+        et = ExifTool()
+        et._stream = MagicMock(return_value=iter(['[{"SourceFile": "test.jpg"\n{ready}\n']))
+        with pytest.raises(RuntimeError, match='No files to parse or invalid data'):
+            list(et.get_metadata())
 
     def test_get_metadata_parses_valid_json(self):
         et = ExifTool()
-        et.execute = MagicMock(return_value='[{"SourceFile": "test.jpg"}]')
-        result = et.get_metadata()
+        et._stream = MagicMock(return_value=iter(['[{"SourceFile": "test.jpg"}]\n{ready}\n']))
+        result = list(et.get_metadata())
         assert result == [{"SourceFile": "test.jpg"}]
 
+    def test_get_metadata_records_split_across_reads(self):
+        et = ExifTool()
+        et._stream = MagicMock(return_value=iter([
+            '[{"SourceFile": "a.j',
+            'pg"},\n{"SourceFile": "b.jpg", "EXIF:CreateDate": "2023:06:15 14:30:00"}',
+            ']\n{rea',
+            'dy}\n',
+        ]))
+        result = list(et.get_metadata())
+        assert result == [
+            {"SourceFile": "a.jpg"},
+            {"SourceFile": "b.jpg", "EXIF:CreateDate": "2023:06:15 14:30:00"},
+        ]
+
+
+class TestWalk:
+    EXTENSIONS = {'JPG', 'PNG'}
+
+    def _make_tree(self, root: Path) -> None:
+        for name in ['top.jpg', 'notes.txt', '.hidden.jpg', 'a/1.jpg', 'a/sub/2.PNG', '.trash/3.jpg']:
+            (root / name).parent.mkdir(parents=True, exist_ok=True)
+            (root / name).write_text(name)
+
+    def test_top_level_only(self, tmp_path):
+        self._make_tree(tmp_path)
+        files, excluded = _walk(str(tmp_path), False, self.EXTENSIONS, None)
+        assert sorted(files) == sorted([str(tmp_path / 'top.jpg'), str(tmp_path / '.hidden.jpg')])
+        assert excluded == 0
+
+    def test_recursive_skips_hidden_directories(self, tmp_path):
+        self._make_tree(tmp_path)
+        files, excluded = _walk(str(tmp_path), True, self.EXTENSIONS, None)
+        assert sorted(files) == sorted([
+            str(tmp_path / 'top.jpg'),
+            str(tmp_path / '.hidden.jpg'),
+            str(tmp_path / 'a' / '1.jpg'),
+            str(tmp_path / 'a' / 'sub' / '2.PNG'),
+        ])
+
+    def test_exclude_patterns_counted(self, tmp_path):
+        self._make_tree(tmp_path)
+        exclude_re = re.compile(fnmatch.translate('*.png') + '|' + fnmatch.translate('*.PNG'))
+        files, excluded = _walk(str(tmp_path), True, self.EXTENSIONS, exclude_re)
+        assert str(tmp_path / 'a' / 'sub' / '2.PNG') not in files
+        assert excluded == 1
+
+    def test_single_file(self, tmp_path):
+        self._make_tree(tmp_path)
+        # named directly, so processed even though its type is not in the list
+        assert _walk(str(tmp_path / 'notes.txt'), False, self.EXTENSIONS, None) == ([str(tmp_path / 'notes.txt')], 0)
+        exclude_re = re.compile(fnmatch.translate('*.txt'))
+        assert _walk(str(tmp_path / 'notes.txt'), False, self.EXTENSIONS, exclude_re) == ([], 1)
+
 
 # ---------------------------------------------------------------------------
 # sortPhotos (integration tests with mocked ExifTool)
 # ---------------------------------------------------------------------------
 
-class TestSortPhotos:
-    def _create_source_files(self, src_dir: Path, filenames: list[str]) -> None:
-        """Create test files with distinct content."""
-        for i, name in enumerate(filenames):
-            filepath = src_dir / name
-            filepath.parent.mkdir(parents=True, exist_ok=True)
-            filepath.write_text(f'content of {name} #{i}')
+class _FakeExifTool:
+    """Stand-in for ExifTool that reports canned metadata for the files it is asked about."""
 
-    def _mock_metadata(self, src_dir: Path, file_dates: dict[str, str]) -> list[dict]:
-        """Create mock metadata for files."""
-        metadata = []
-        for filename, date_str in file_dates.items():
-            entry = {
-                'SourceFile': str(src_dir / filename),
-                'EXIF:CreateDate': date_str,
-            }
-            metadata.append(entry)
-        return metadata
-
-    def test_test_mode_does_not_move_files(self, tmp_path):
-        src_dir = tmp_path / 'src'
-        dest_dir = tmp_path / 'dest'
-        src_dir.mkdir()
-        dest_dir.mkdir()
+    def __init__(self) -> None:
+        self.metadata: list[dict] = []
+        self.calls: list[tuple[str, ...]] = []
 
-        self._create_source_files(src_dir, ['photo1.jpg'])
-        metadata = self._mock_metadata(src_dir, {'photo1.jpg': '2023:06:15 14:30:00'})
+    def __enter__(self) -> _FakeExifTool:
+        return self
 
-        with patch('src.sortphotos.ExifTool') as MockExifTool:
-            mock_et = MagicMock()
-            mock_et.get_metadata.return_value = metadata
-            mock_et.__enter__ = MagicMock(return_value=mock_et)
-            mock_et.__exit__ = MagicMock(return_value=False)
-            MockExifTool.return_value = mock_et
+    def __exit__(self, *args) -> bool:
+        return False
 
-            stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, test=True)
+    def supported_extensions(self) -> set[str]:
+        return {'JPG', 'RAW', 'CR2'}
 
-        # file should still be in source
-        assert (src_dir / 'photo1.jpg').exists()
-        # destination should not have the file
-        assert not list(dest_dir.rglob('*.jpg'))
-        assert stats['processed'] == 1
+    def get_metadata(self, *args: str) -> list[dict]:
+        self.calls.append(args)
+        return [d for d in self.metadata if d['SourceFile'] in args]
 
-    def test_copy_mode_preserves_source(self, tmp_path):
-        src_dir = tmp_path / 'src'
-        dest_dir = tmp_path / 'dest'
-        src_dir.mkdir()
-        dest_dir.mkdir()
 
-        self._create_source_files(src_dir, ['photo1.jpg'])
-        metadata = self._mock_metadata(src_dir, {'photo1.jpg': '2023:06:15 14:30:00'})
+@pytest.fixture
+def mock_exiftool(monkeypatch):
+    """Replace ExifTool with a _FakeExifTool; returns a setter for the metadata it reports."""
+    fake = _FakeExifTool()
+    monkeypatch.setattr('src.sortphotos.ExifTool', lambda *args, **kwargs: fake)
 
-        with patch('src.sortphotos.ExifTool') as MockExifTool:
-            mock_et = MagicMock()
-            mock_et.get_metadata.return_value = metadata
-            mock_et.__enter__ = MagicMock(return_value=mock_et)
-            mock_et.__exit__ = MagicMock(return_value=False)
-            MockExifTool.return_value = mock_et
+    def set_metadata(metadata: list[dict]) -> _FakeExifTool:
+        fake.metadata = metadata
+        return fake
 
-            stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, copy_files=True)
+    return set_metadata
 
-        # source file preserved
-        assert (src_dir / 'photo1.jpg').exists()
-        # destination has the file
-        dest_files = list(dest_dir.rglob('*.jpg'))
-        assert len(dest_files) == 1
-        assert stats['processed'] == 1
 
-    def test_move_mode_removes_source(self, tmp_path):
-        src_dir = tmp_path / 'src'
-        dest_dir = tmp_path / 'dest'
-        src_dir.mkdir()
-        dest_dir.mkdir()
+def _list_jpgs(path: Path) -> list[str]:
+    """Sorted names of the .jpg files directly in path."""
+    return sorted(name for name in os.listdir(path) if name.lower().endswith('.jpg'))
 
-        self._create_source_files(src_dir, ['photo1.jpg'])
-        metadata = self._mock_metadata(src_dir, {'photo1.jpg': '2023:06:15 14:30:00'})
 
-        with patch('src.sortphotos.ExifTool') as MockExifTool:
-            mock_et = MagicMock()
-            mock_et.get_metadata.return_value = metadata
-            mock_et.__enter__ = MagicMock(return_value=mock_et)
-            mock_et.__exit__ = MagicMock(return_value=False)
-            MockExifTool.return_value = mock_et
+@pytest.fixture
+def dirs(tmp_path):
+    """Empty source and destination directories."""
+    src_dir = tmp_path / 'src'
+    dest_dir = tmp_path / 'dest'
+    src_dir.mkdir()
+    dest_dir.mkdir()
+    return src_dir, dest_dir
 
-            stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, copy_files=False)
 
-        # source file gone
-        assert not (src_dir / 'photo1.jpg').exists()
-        # destination has it
-        dest_files = list(dest_dir.rglob('*.jpg'))
-        assert len(dest_files) == 1
+# (source file, its date, sortPhotos options, expected stats, source kept, files at destination)
+_SINGLE_FILE_CASES = (
+    pytest.param('photo1.jpg', '2023:06:15 14:30:00', {'test': True},
+                 {'processed': 1}, True, [], id='test_mode_does_not_move_files'),
+    pytest.param('photo1.jpg', '2023:06:15 14:30:00', {'copy_files': True},
+                 {'processed': 1}, True, ['photo1.jpg'], id='copy_mode_preserves_source'),
+    pytest.param('photo1.jpg', '2023:06:15 14:30:00', {'copy_files': False},
+                 {'processed': 1}, False, ['photo1.jpg'], id='move_mode_removes_source'),
+    pytest.param('.hidden.jpg', '2023:06:15 14:30:00', {'test': True},
+                 {'skipped_hidden': 1, 'processed': 0}, True, [], id='hidden_files_skipped'),
+    pytest.param('nodate.jpg', 'not a date', {'test': True},
+                 {'skipped_no_date': 1, 'processed': 0}, True, [], id='no_date_skipped'),
+)
+
+
+class TestSortPhotos:
+    def _create_source_files(self, src_dir: Path, filenames: list[str]) -> None:
+        """Create test files with distinct content."""
+        for i, name in enumerate(filenames):
+            path = os.path.join(src_dir, name)
+            if '/' in name:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                os.write(fd, f'content of {name} #{i}'.encode())
+            finally:
+                os.close(fd)
+
+    def _mock_metadata(self, src_dir: Path, file_dates: dict[str, str]) -> list[dict]:
+        """Create mock metadata for files."""
+        # SourceFile must match the paths _walk reports, separators included
+        src = os.fspath(src_dir)
+        return [
+            {'SourceFile': os.path.join(src, filename.replace('/', os.sep)), 'EXIF:CreateDate': date_str}
+            for filename, date_str in file_dates.items()
+        ]
+
+    @pytest.mark.parametrize('filename,date_str,options,expected,src_kept,dest_files', _SINGLE_FILE_CASES)
+    def test_single_file(self, dirs, mock_exiftool, filename, date_str, options, expected, src_kept, dest_files):
+        src_dir, dest_dir = dirs
+
+        self._create_source_files(src_dir, [filename])
+        mock_exiftool(self._mock_metadata(src_dir, {filename: date_str}))
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, **options)
+
+        assert {'processed', 'skipped_no_date', 'skipped_hidden', 'skipped_duplicate', 'errors'} <= stats.keys()
+        assert {key: stats[key] for key in expected} == expected
+        assert (src_dir / filename).exists() == src_kept
+        assert sorted(f.name for f in dest_dir.rglob('*.jpg')) == dest_files
+
+    def test_test_mode_detects_duplicates_within_run(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
+
+        # identical files that map to the same destination name
+        for name in ['a/photo1.jpg', 'b/photo1.jpg']:
+            (src_dir / name).parent.mkdir()
+            (src_dir / name).write_text('identical content')
+        metadata = self._mock_metadata(src_dir, {
+            'a/photo1.jpg': '2023:06:15 14:30:00',
+            'b/photo1.jpg': '2023:06:15 14:30:00',
+        })
+
+        mock_exiftool(metadata)
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None,
+                         recursive=True, test=True)
+
         assert stats['processed'] == 1
+        assert stats['skipped_duplicate'] == 1
+        assert not list(dest_dir.rglob('*.jpg'))
 
-    def test_duplicate_detection_skips_identical(self, tmp_path):
-        src_dir = tmp_path / 'src'
-        dest_dir = tmp_path / 'dest'
-        src_dir.mkdir()
-        dest_dir.mkdir()
+    def test_duplicate_detection_skips_identical(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
 
         # create source file
         (src_dir / 'photo1.jpg').write_text('identical content')
@@ -370,23 +584,14 @@ class TestSortPhotos:
 
         metadata = self._mock_metadata(src_dir, {'photo1.jpg': '2023:06:15 14:30:00'})
 
-        with patch('src.sortphotos.ExifTool') as MockExifTool:
-            mock_et = MagicMock()
-            mock_et.get_metadata.return_value = metadata
-            mock_et.__enter__ = MagicMock(return_value=mock_et)
-            mock_et.__exit__ = MagicMock(return_value=False)
-            MockExifTool.return_value = mock_et
-
-            stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, copy_files=True)
+        mock_exiftool(metadata)
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, copy_files=True)
 
         assert stats['skipped_duplicate'] == 1
         assert stats['processed'] == 0
 
-    def test_collision_appends_number(self, tmp_path):
-        src_dir = tmp_path / 'src'
-        dest_dir = tmp_path / 'dest'
-        src_dir.mkdir()
-        dest_dir.mkdir()
+    def test_collision_appends_number(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
 
         # create source file
         (src_dir / 'photo1.jpg').write_text('new content')
@@ -398,66 +603,84 @@ class TestSortPhotos:
 
         metadata = self._mock_metadata(src_dir, {'photo1.jpg': '2023:06:15 14:30:00'})
 
-        with patch('src.sortphotos.ExifTool') as MockExifTool:
-            mock_et = MagicMock()
-            mock_et.get_metadata.return_value = metadata
-            mock_et.__enter__ = MagicMock(return_value=mock_et)
-            mock_et.__exit__ = MagicMock(return_value=False)
-            MockExifTool.return_value = mock_et
-
-            stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, copy_files=True)
+        mock_exiftool(metadata)
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, copy_files=True)
 
         assert stats['renamed_collision'] >= 1
         # should have both original and renamed file
-        dest_files = list(dest_subdir.glob('*.jpg'))
-        assert len(dest_files) == 2
+        assert len(_list_jpgs(dest_subdir)) == 2
 
-    def test_hidden_files_skipped(self, tmp_path):
-        src_dir = tmp_path / 'src'
-        dest_dir = tmp_path / 'dest'
-        src_dir.mkdir()
-        dest_dir.mkdir()
+    def test_collision_ignores_case(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
 
-        self._create_source_files(src_dir, ['.hidden.jpg'])
-        metadata = self._mock_metadata(src_dir, {'.hidden.jpg': '2023:06:15 14:30:00'})
+        # on case-insensitive volumes these names are the same file
+        (src_dir / 'img_0001.jpg').write_text('new content')
+        dest_subdir = dest_dir / '2023' / '06-Jun'
+        dest_subdir.mkdir(parents=True)
+        (dest_subdir / 'IMG_0001.JPG').write_text('old content')
 
-        with patch('src.sortphotos.ExifTool') as MockExifTool:
-            mock_et = MagicMock()
-            mock_et.get_metadata.return_value = metadata
-            mock_et.__enter__ = MagicMock(return_value=mock_et)
-            mock_et.__exit__ = MagicMock(return_value=False)
-            MockExifTool.return_value = mock_et
+        mock_exiftool(self._mock_metadata(src_dir, {'img_0001.jpg': '2023:06:15 14:30:00'}))
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, copy_files=True)
 
-            stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, test=True)
+        assert stats['renamed_collision'] == 1
+        assert _list_jpgs(dest_subdir) == ['IMG_0001.JPG', 'img_0001_1.jpg']
+        assert (dest_subdir / 'IMG_0001.JPG').read_text() == 'old content'
 
-        assert stats['skipped_hidden'] == 1
-        assert stats['processed'] == 0
+    def test_duplicate_detection_ignores_case(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
+
+        (src_dir / 'img_0001.jpg').write_text('identical content')
+        dest_subdir = dest_dir / '2023' / '06-Jun'
+        dest_subdir.mkdir(parents=True)
+        (dest_subdir / 'IMG_0001.JPG').write_text('identical content')
+
+        mock_exiftool(self._mock_metadata(src_dir, {'img_0001.jpg': '2023:06:15 14:30:00'}))
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, copy_files=True)
+
+        assert stats['skipped_duplicate'] == 1
+        assert _list_jpgs(dest_subdir) == ['IMG_0001.JPG']
 
-    def test_no_date_skipped(self, tmp_path):
-        src_dir = tmp_path / 'src'
-        dest_dir = tmp_path / 'dest'
-        src_dir.mkdir()
-        dest_dir.mkdir()
+    def test_collision_within_run_appends_number(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
 
-        self._create_source_files(src_dir, ['nodate.jpg'])
-        metadata = [{'SourceFile': str(src_dir / 'nodate.jpg'), 'EXIF:Something': 'not a date'}]
+        # two different source files that map to the same destination name
+        self._create_source_files(src_dir, ['a/photo1.jpg', 'b/photo1.jpg'])
+        metadata = self._mock_metadata(src_dir, {
+            'a/photo1.jpg': '2023:06:15 14:30:00',
+            'b/photo1.jpg': '2023:06:15 14:30:00',
+        })
 
-        with patch('src.sortphotos.ExifTool') as MockExifTool:
-            mock_et = MagicMock()
-            mock_et.get_metadata.return_value = metadata
-            mock_et.__enter__ = MagicMock(return_value=mock_et)
-            mock_et.__exit__ = MagicMock(return_value=False)
-            MockExifTool.return_value = mock_et
+        mock_exiftool(metadata)
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None,
+                         recursive=True, copy_files=True)
 
-            stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, test=True)
+        assert stats['processed'] == 2
+        assert stats['renamed_collision'] == 1
+        dest_subdir = dest_dir / '2023' / '06-Jun'
+        assert _list_jpgs(dest_subdir) == ['photo1.jpg', 'photo1_1.jpg']
 
-        assert stats['skipped_no_date'] == 1
+    def test_duplicate_of_renamed_file_skipped(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
 
-    def test_exclude_patterns(self, tmp_path):
-        src_dir = tmp_path / 'src'
-        dest_dir = tmp_path / 'dest'
-        src_dir.mkdir()
-        dest_dir.mkdir()
+        (src_dir / 'photo1.jpg').write_text('new content')
+
+        # the name is taken by a different file, the first suffix by an identical one
+        dest_subdir = dest_dir / '2023' / '06-Jun'
+        dest_subdir.mkdir(parents=True)
+        (dest_subdir / 'photo1.jpg').write_text('old content')
+        (dest_subdir / 'photo1_1.jpg').write_text('new content')
+
+        metadata = self._mock_metadata(src_dir, {'photo1.jpg': '2023:06:15 14:30:00'})
+
+        mock_exiftool(metadata)
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, copy_files=True)
+
+        assert stats['skipped_duplicate'] == 1
+        assert stats['processed'] == 0
+        assert _list_jpgs(dest_subdir) == ['photo1.jpg', 'photo1_1.jpg']
+
+    def test_exclude_patterns(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
 
         self._create_source_files(src_dir, ['photo.jpg', 'photo.raw'])
         metadata = self._mock_metadata(src_dir, {
@@ -465,92 +688,114 @@ class TestSortPhotos:
             'photo.raw': '2023:06:15 14:30:00',
         })
 
-        with patch('src.sortphotos.ExifTool') as MockExifTool:
-            mock_et = MagicMock()
-            mock_et.get_metadata.return_value = metadata
-            mock_et.__enter__ = MagicMock(return_value=mock_et)
-            mock_et.__exit__ = MagicMock(return_value=False)
-            MockExifTool.return_value = mock_et
-
-            stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None,
-                             test=True, exclude_patterns=['*.raw'])
+        mock_exiftool(metadata)
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None,
+                         test=True, exclude_patterns=['*.raw'])
 
         assert stats['skipped_excluded'] == 1
         assert stats['processed'] == 1
 
+    def test_multiple_exclude_patterns(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
+
+        self._create_source_files(src_dir, ['photo.jpg', 'photo.raw', 'photo.cr2'])
+        metadata = self._mock_metadata(src_dir, {
+            'photo.jpg': '2023:06:15 14:30:00',
+            'photo.raw': '2023:06:15 14:30:00',
+            'photo.cr2': '2023:06:15 14:30:00',
+        })
+
+        mock_exiftool(metadata)
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None,
+                         test=True, exclude_patterns=['*.raw', f'{src_dir}/*.cr2'])
+
+        assert stats['skipped_excluded'] == 2
+        assert stats['processed'] == 1
+
+    def test_single_file_source(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
+
+        self._create_source_files(src_dir, ['photo1.jpg'])
+        mock_exiftool(self._mock_metadata(src_dir, {'photo1.jpg': '2023:06:15 14:30:00'}))
+        stats = sortPhotos(str(src_dir / 'photo1.jpg'), str(dest_dir), '%Y/%m-%b', None, copy_files=True)
+
+        assert stats['processed'] == 1
+        assert _list_jpgs(dest_dir / '2023' / '06-Jun') == ['photo1.jpg']
+
     def test_nonexistent_source_raises(self, tmp_path):
         with pytest.raises(Exception, match='Source directory does not exist'):
             sortPhotos(str(tmp_path / 'nonexistent'), str(tmp_path), '%Y/%m-%b', None)
 
-    def test_rename_format(self, tmp_path):
-        src_dir = tmp_path / 'src'
-        dest_dir = tmp_path / 'dest'
-        src_dir.mkdir()
-        dest_dir.mkdir()
+    def test_rename_format(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
 
         self._create_source_files(src_dir, ['photo1.JPG'])
         metadata = self._mock_metadata(src_dir, {'photo1.JPG': '2023:06:15 14:30:00'})
 
-        with patch('src.sortphotos.ExifTool') as MockExifTool:
-            mock_et = MagicMock()
-            mock_et.get_metadata.return_value = metadata
-            mock_et.__enter__ = MagicMock(return_value=mock_et)
-            mock_et.__exit__ = MagicMock(return_value=False)
-            MockExifTool.return_value = mock_et
-
-            stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b',
-                             '%Y%m%d_%H%M%S', copy_files=True)
+        mock_exiftool(metadata)
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b',
+                         '%Y%m%d_%H%M%S', copy_files=True)
 
-        dest_files = list(dest_dir.rglob('*.jpg'))
-        assert len(dest_files) == 1
         # renamed file should have date-based name with lowercase extension
-        assert dest_files[0].name == '20230615_143000.jpg'
+        assert _list_jpgs(dest_dir / '2023' / '06-Jun') == ['20230615_143000.jpg']
 
-    def test_stats_returned(self, tmp_path):
-        src_dir = tmp_path / 'src'
-        dest_dir = tmp_path / 'dest'
-        src_dir.mkdir()
-        dest_dir.mkdir()
+    def test_sort_format_with_time(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
 
-        self._create_source_files(src_dir, ['photo1.jpg'])
-        metadata = self._mock_metadata(src_dir, {'photo1.jpg': '2023:06:15 14:30:00'})
-
-        with patch('src.sortphotos.ExifTool') as MockExifTool:
-            mock_et = MagicMock()
-            mock_et.get_metadata.return_value = metadata
-            mock_et.__enter__ = MagicMock(return_value=mock_et)
-            mock_et.__exit__ = MagicMock(return_value=False)
-            MockExifTool.return_value = mock_et
+        self._create_source_files(src_dir, ['photo1.jpg', 'photo2.jpg'])
+        metadata = self._mock_metadata(src_dir, {
+            'photo1.jpg': '2023:06:15 09:30:00',
+            'photo2.jpg': '2023:06:15 14:30:00',
+        })
 
-            stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, test=True)
+        mock_exiftool(metadata)
+        sortPhotos(str(src_dir), str(dest_dir), '%Y/%H', None, copy_files=True)
 
-        assert isinstance(stats, dict)
-        assert 'processed' in stats
-        assert 'skipped_no_date' in stats
-        assert 'skipped_hidden' in stats
-        assert 'skipped_duplicate' in stats
-        assert 'errors' in stats
+        assert (dest_dir / '2023' / '09' / 'photo1.jpg').exists()
+        assert (dest_dir / '2023' / '14' / 'photo2.jpg').exists()
 
-    def test_parallel_jobs(self, tmp_path):
-        src_dir = tmp_path / 'src'
-        dest_dir = tmp_path / 'dest'
-        src_dir.mkdir()
-        dest_dir.mkdir()
+    def test_parallel_jobs(self, dirs, mock_exiftool):
+        src_dir, dest_dir = dirs
 
         files = {f'photo{i}.jpg': f'2023:06:{15+i:02d} 14:30:00' for i in range(5)}
         self._create_source_files(src_dir, list(files.keys()))
         metadata = self._mock_metadata(src_dir, files)
 
-        with patch('src.sortphotos.ExifTool') as MockExifTool:
-            mock_et = MagicMock()
-            mock_et.get_metadata.return_value = metadata
-            mock_et.__enter__ = MagicMock(return_value=mock_et)
-            mock_et.__exit__ = MagicMock(return_value=False)
-            MockExifTool.return_value = mock_et
+        mock_exiftool(metadata)
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None,
+                         copy_files=True, jobs=2)
+
+        assert stats['processed'] == 5
+        assert len(_list_jpgs(dest_dir / '2023' / '06-Jun')) == 5
+
+    def test_parallel_jobs_with_process_pool(self, dirs, mock_exiftool, monkeypatch):
+        src_dir, dest_dir = dirs
+
+        files = {f'photo{i}.jpg': f'2023:06:{15+i:02d} 14:30:00' for i in range(5)}
+        self._create_source_files(src_dir, list(files.keys()))
+        metadata = self._mock_metadata(src_dir, files)
 
-            stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None,
-                             copy_files=True, jobs=2)
+        monkeypatch.setattr('src.sortphotos._PROCESS_POOL_MIN_TRANSFERS', 2)
+        mock_exiftool(metadata)
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None, jobs=2)
 
         assert stats['processed'] == 5
-        dest_files = list(dest_dir.rglob('*.jpg'))
-        assert len(dest_files) == 5
+        assert stats['errors'] == 0
+        assert not _list_jpgs(src_dir)
+        assert len(_list_jpgs(dest_dir / '2023' / '06-Jun')) == 5
+
+    def test_parallel_exiftool_processes(self, dirs, mock_exiftool, monkeypatch):
+        src_dir, dest_dir = dirs
+
+        files = {f'a/photo{i}.jpg': f'2023:06:{15+i:02d} 14:30:00' for i in range(4)}
+        self._create_source_files(src_dir, list(files.keys()))
+        metadata = self._mock_metadata(src_dir, files)
+
+        monkeypatch.setattr('src.sortphotos._MIN_FILES_PER_EXIFTOOL', 1)
+        fake = mock_exiftool(metadata)
+        stats = sortPhotos(str(src_dir), str(dest_dir), '%Y/%m-%b', None,
+                         recursive=True, copy_files=True, jobs=2)
+
+        # one call per ExifTool process
+        assert len(fake.calls) == 2
+        assert stats['processed'] == 4